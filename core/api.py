@@ -1,14 +1,21 @@
 from ninja import Router
-from typing import List
+from typing import List, Literal
 from django.contrib.auth.models import User
 from .models import Employee, TimeEntry, WorkShift, Role
 from pydantic import BaseModel
 from ninja_jwt.authentication import JWTAuth
-from datetime import datetime, date, time, timedelta
-from django.utils.timezone import now
+from datetime import datetime, date, time, timedelta, timezone as dt_timezone
+from django.utils.timezone import now, make_aware
 from ninja.errors import HttpError
-from .utils import require_hr_or_admin
+from .utils import require_hr_or_admin, idempotent
 from django.db.models import F, ExpressionWrapper, DurationField
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from hashlib import md5
+import secrets
+from .auth import CalendarTokenAuth
 
 api = Router(auth=JWTAuth())
 
@@ -61,6 +68,17 @@ class WorkShiftOut(BaseModel):
     class Config:
         from_attributes = True
 
+class MyShiftOut(BaseModel):
+    id: int
+    date: date
+    start_time: time
+    end_time: time
+    status: Literal["worked", "upcoming", "missed"]
+
+class CalendarTokenOut(BaseModel):
+    token: str
+    url: str
+
 # ==================== СОТРУДНИКИ ====================
 @api.get("/employees", response=List[EmployeeOut], tags=["Сотрудники"])
 def list_employees(request):
@@ -115,7 +133,10 @@ def delete_employee(request, employee_id: int):
     return {"success": True}
 
 # ==================== УЧЕТ ВРЕМЕНИ ====================
+CLOCK_IN_EARLY_MINUTES = 15
+
 @api.post("/time-entry/start", response=TimeEntryOut, tags=["Учёт времени"])
+@idempotent(TimeEntryOut)
 def start_time_entry(request):
     user = request.auth
     employee = Employee.objects.get(user=user)
@@ -135,7 +156,7 @@ def start_time_entry(request):
 
     matched = False
     for shift in today_shifts:
-        start_window = (datetime.combine(today, shift.start_time) - timedelta(minutes=15)).time()
+        start_window = (datetime.combine(today, shift.start_time) - timedelta(minutes=CLOCK_IN_EARLY_MINUTES)).time()
         end_limit = shift.end_time  # До конца смены
     
         if start_window <= current_time <= end_limit:
@@ -151,6 +172,7 @@ def start_time_entry(request):
     return entry
 
 @api.post("/time-entry/stop", response=TimeEntryOut, tags=["Учёт времени"])
+@idempotent(TimeEntryOut)
 def stop_time_entry(request):
     user = request.auth
     employee = Employee.objects.get(user=user)
@@ -216,6 +238,164 @@ def list_shifts(request):
         ) for shift in shifts
     ]
 
+MY_SHIFTS_DEFAULT_DAYS = 30
+MY_SHIFTS_MAX_DAYS = 366
+SHIFTS_ICS_CACHE_TTL = 300
+SHIFT_STATUS_TITLES = {
+    "worked": "отработана",
+    "upcoming": "предстоит",
+    "missed": "пропущена",
+}
+# SEQUENCE растёт вместе со статусом, чтобы календари применяли обновление SUMMARY
+SHIFT_STATUS_SEQUENCE = {
+    "upcoming": 0,
+    "missed": 1,
+    "worked": 2,
+}
+ICS_EPOCH = make_aware(datetime(1970, 1, 1))
+
+def _shift_bounds(shift):
+    start = make_aware(datetime.combine(shift.date, shift.start_time))
+    end = make_aware(datetime.combine(shift.date, shift.end_time))
+    if end <= start:  # ночная смена заканчивается на следующий день
+        end += timedelta(days=1)
+    return start, end
+
+def _shift_status(shift, entries, current):
+    start, end = _shift_bounds(shift)
+    window_start = start - timedelta(minutes=CLOCK_IN_EARLY_MINUTES)
+    if any(window_start <= started_at <= end for started_at in entries):
+        return "worked"
+    return "upcoming" if end > current else "missed"
+
+def _shift_range(date_from, date_to):
+    date_from = date_from or now().date()
+    date_to = date_to or date_from + timedelta(days=MY_SHIFTS_DEFAULT_DAYS)
+    if date_from > date_to:
+        raise HttpError(400, "Дата начала периода позже даты окончания")
+    if (date_to - date_from).days > MY_SHIFTS_MAX_DAYS:
+        raise HttpError(400, f"Период не может быть длиннее {MY_SHIFTS_MAX_DAYS} дней")
+    return date_from, date_to
+
+def _my_shifts(user, date_from, date_to):
+    employee = Employee.objects.get(user=user)
+    shifts = list(
+        WorkShift.objects
+        .filter(employees=employee, date__range=(date_from, date_to))
+        .order_by("date", "start_time")
+    )
+    # Отметки сопоставляются с окном смены (за 15 минут до начала и до конца),
+    # поэтому берём все отметки периода одним запросом с запасом на ночные смены
+    entries = list(
+        TimeEntry.objects.filter(
+            employee=employee,
+            started_at__gte=make_aware(datetime.combine(date_from, time.min)) - timedelta(minutes=CLOCK_IN_EARLY_MINUTES),
+            started_at__lt=make_aware(datetime.combine(date_to + timedelta(days=2), time.min)),
+        ).values_list("started_at", flat=True)
+    )
+    current = now()
+    return [(shift, _shift_status(shift, entries, current)) for shift in shifts]
+
+def _ics_escape(value):
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def _ics_fold(line):
+    # RFC 5545: строки длиннее 75 октетов переносятся, продолжение начинается с пробела
+    data = line.encode()
+    parts = []
+    limit = 75
+    while len(data) > limit:
+        cut = limit
+        while data[cut] & 0xC0 == 0x80:  # не разрываем многобайтовый символ
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+        limit = 74
+    parts.append(data)
+    return b"\r\n ".join(parts)
+
+def _ics_datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def _ics_dtstamp(status, start, end):
+    # Момент, с которого действует статус: всегда в прошлом и не меняется между опросами
+    if status == "worked":
+        return start - timedelta(minutes=CLOCK_IN_EARLY_MINUTES)
+    if status == "missed":
+        return end
+    return ICS_EPOCH
+
+def _render_shifts_ics(user, date_from, date_to):
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//HR Management API//Shifts//RU",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_ics_escape(user.username)} — смены",
+    ]
+    for shift, status in _my_shifts(user, date_from, date_to):
+        start, end = _shift_bounds(shift)
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:shift-{shift.id}-{user.id}@hr-api",
+            f"DTSTAMP:{_ics_datetime(_ics_dtstamp(status, start, end))}",
+            f"SEQUENCE:{SHIFT_STATUS_SEQUENCE[status]}",
+            f"DTSTART:{_ics_datetime(start)}",
+            f"DTEND:{_ics_datetime(end)}",
+            f"SUMMARY:{_ics_escape(f'Смена ({SHIFT_STATUS_TITLES[status]})')}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return b"\r\n".join(_ics_fold(line) for line in lines) + b"\r\n"
+
+@api.get("/shifts/my", response=List[MyShiftOut], tags=["Смены"])
+def my_shifts(request, date_from: date = None, date_to: date = None):
+    date_from, date_to = _shift_range(date_from, date_to)
+    return [
+        MyShiftOut(
+            id=shift.id,
+            date=shift.date,
+            start_time=shift.start_time,
+            end_time=shift.end_time,
+            status=status,
+        ) for shift, status in _my_shifts(request.auth, date_from, date_to)
+    ]
+
+@api.get("/shifts/my.ics", auth=[CalendarTokenAuth(), JWTAuth()], url_name="my_shifts_ics", tags=["Смены"])
+def my_shifts_ics(request, date_from: date = None, date_to: date = None):
+    date_from, date_to = _shift_range(date_from, date_to)
+    cache_key = f"shifts-ics:{request.auth.pk}:{date_from}:{date_to}"
+    cached = cache.get(cache_key)
+    if cached is None:
+        body = _render_shifts_ics(request.auth, date_from, date_to)
+        cached = (body, f'"{md5(body, usedforsecurity=False).hexdigest()}"')
+        cache.set(cache_key, cached, SHIFTS_ICS_CACHE_TTL)
+    body, etag = cached
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type="text/calendar; charset=utf-8")
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, max_age=SHIFTS_ICS_CACHE_TTL)
+    return response
+
+@api.post("/shifts/my/calendar-token", response=CalendarTokenOut, tags=["Смены"])
+def create_calendar_token(request):
+    employee = Employee.objects.get(user=request.auth)
+    employee.calendar_token = secrets.token_urlsafe(32)
+    employee.save(update_fields=["calendar_token"])
+    url = reverse(f"{request.resolver_match.namespace}:my_shifts_ics")
+    return CalendarTokenOut(
+        token=employee.calendar_token,
+        url=request.build_absolute_uri(f"{url}?token={employee.calendar_token}"),
+    )
+
+@api.delete("/shifts/my/calendar-token", tags=["Смены"])
+def revoke_calendar_token(request):
+    Employee.objects.filter(user=request.auth).update(calendar_token=None)
+    return {"success": True}
+
 @api.post("/shifts", response=WorkShiftOut, tags=["Смены"])
 def create_shift(request, data: WorkShiftIn):
     require_hr_or_admin(request)
@@ -5,9 +5,21 @@ from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from pydantic import BaseModel
 from ninja.errors import HttpError
+from ninja.security import APIKeyQuery
+from .models import Employee
 
 router = Router()
 
+class CalendarTokenAuth(APIKeyQuery):
+    """Долгоживущий токен календарной подписки: ?token=... в URL фида."""
+    param_name = "token"
+
+    def authenticate(self, request, key):
+        if not key:
+            return None
+        employee = Employee.objects.select_related("user").filter(calendar_token=key).first()
+        return employee.user if employee else None
+
 class RegisterSchema(BaseModel):
     username: str
     password: str
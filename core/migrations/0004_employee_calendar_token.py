@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_workshift'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='calendar_token',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
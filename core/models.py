@@ -12,6 +12,7 @@ class Employee(models.Model):
     position = models.CharField(max_length=100)
     hourly_rate = models.DecimalField(max_digits=8, decimal_places=2)
     role = models.CharField(max_length=10, choices=Role.choices, default=Role.EMPLOYEE)
+    calendar_token = models.CharField(max_length=64, unique=True, null=True, blank=True)
 
     def __str__(self):
         return f"{self.user.username} ({self.position})"
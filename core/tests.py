@@ -1,3 +1,207 @@
-from django.test import TestCase
+from datetime import datetime, time, timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.utils.timezone import now, make_aware
+from ninja_jwt.tokens import RefreshToken
+from .models import Employee, TimeEntry, WorkShift
+from .utils import idempotency_cache_key
 
-# Create your tests here.
+START_URL = "/api/core/time-entry/start"
+STOP_URL = "/api/core/time-entry/stop"
+MY_SHIFTS_URL = "/api/core/shifts/my"
+MY_SHIFTS_ICS_URL = "/api/core/shifts/my.ics"
+CALENDAR_TOKEN_URL = "/api/core/shifts/my/calendar-token"
+
+
+def make_employee(username):
+    user = User.objects.create_user(username=username, password="secret")
+    return Employee.objects.create(user=user, position="Оператор", hourly_rate=100)
+
+
+def jwt_client(user):
+    token = RefreshToken.for_user(user).access_token
+    return Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.employee = make_employee("worker")
+        self.client = jwt_client(self.employee.user)
+        # Смена на весь день, чтобы начать её можно было в любое время
+        shift = WorkShift.objects.create(date=now().date(), start_time=time(0, 15), end_time=time(23, 59, 59))
+        shift.employees.add(self.employee)
+        self.shift = shift
+
+    def test_same_key_replays_first_response(self):
+        first = self.client.post(START_URL, HTTP_IDEMPOTENCY_KEY="tap1")
+        retry = self.client.post(START_URL, HTTP_IDEMPOTENCY_KEY="tap1")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(first.json(), retry.json())
+        self.assertEqual(TimeEntry.objects.count(), 1)
+
+    def test_result_stored_before_lock_is_replayed(self):
+        first = self.client.post(START_URL, HTTP_IDEMPOTENCY_KEY="tap1")
+        cache_key = idempotency_cache_key(self.employee.user.pk, START_URL, "tap1")
+        real_get = cache.get
+        misses = []
+
+        # Повтор не увидел результат до взятия лока: первый запрос завершился между проверками
+        def get_missing_once(key, *args, **kwargs):
+            if key == cache_key and not misses:
+                misses.append(key)
+                return None
+            return real_get(key, *args, **kwargs)
+
+        with mock.patch.object(cache, "get", side_effect=get_missing_once):
+            retry = self.client.post(START_URL, HTTP_IDEMPOTENCY_KEY="tap1")
+        self.assertEqual(misses, [cache_key])
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(TimeEntry.objects.count(), 1)
+
+    def test_without_header_behaves_as_before(self):
+        self.assertEqual(self.client.post(START_URL).status_code, 200)
+        second = self.client.post(START_URL)
+        self.assertEqual(second.status_code, 400)
+        self.assertEqual(TimeEntry.objects.count(), 1)
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.client.post(STOP_URL, HTTP_IDEMPOTENCY_KEY="tap1").status_code, 400)
+        self.client.post(START_URL)
+        self.assertEqual(self.client.post(STOP_URL, HTTP_IDEMPOTENCY_KEY="tap1").status_code, 200)
+
+    def test_key_is_scoped_per_path(self):
+        started = self.client.post(START_URL, HTTP_IDEMPOTENCY_KEY="tap1")
+        stopped = self.client.post(STOP_URL, HTTP_IDEMPOTENCY_KEY="tap1")
+        self.assertEqual(stopped.status_code, 200)
+        self.assertEqual(stopped.json()["id"], started.json()["id"])
+        self.assertIsNotNone(stopped.json()["ended_at"])
+
+    def test_key_is_scoped_per_user(self):
+        other = make_employee("other")
+        self.shift.employees.add(other)
+        mine = self.client.post(START_URL, HTTP_IDEMPOTENCY_KEY="tap1")
+        theirs = jwt_client(other.user).post(START_URL, HTTP_IDEMPOTENCY_KEY="tap1")
+        self.assertNotEqual(mine.json()["id"], theirs.json()["id"])
+        self.assertEqual(TimeEntry.objects.count(), 2)
+
+    def test_held_lock_returns_409(self):
+        cache_key = idempotency_cache_key(self.employee.user.pk, START_URL, "tap1")
+        cache.add(f"{cache_key}:lock", "someone-else", 10)
+        response = self.client.post(START_URL, HTTP_IDEMPOTENCY_KEY="tap1")
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("Retry-After", response.headers)
+        self.assertEqual(TimeEntry.objects.count(), 0)
+        # Чужой лок не снимается
+        self.assertEqual(cache.get(f"{cache_key}:lock"), "someone-else")
+
+    def test_invalid_key_is_rejected(self):
+        self.assertEqual(self.client.post(START_URL, HTTP_IDEMPOTENCY_KEY="x" * 256).status_code, 400)
+        self.assertEqual(self.client.post(START_URL, HTTP_IDEMPOTENCY_KEY="a b").status_code, 400)
+        self.assertEqual(TimeEntry.objects.count(), 0)
+
+
+class MyShiftsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.employee = make_employee("worker")
+        self.client = jwt_client(self.employee.user)
+        self.today = now().date()
+
+    def add_shift(self, days, start, end, employee=None):
+        shift = WorkShift.objects.create(date=self.today + timedelta(days=days), start_time=start, end_time=end)
+        shift.employees.add(employee or self.employee)
+        return shift
+
+    def clock_in(self, days, at):
+        started_at = make_aware(datetime.combine(self.today + timedelta(days=days), at))
+        TimeEntry.objects.create(employee=self.employee, started_at=started_at, ended_at=started_at)
+
+    def get_statuses(self, **params):
+        params.setdefault("date_from", str(self.today - timedelta(days=10)))
+        response = self.client.get(MY_SHIFTS_URL, params)
+        self.assertEqual(response.status_code, 200)
+        return {item["id"]: item["status"] for item in response.json()}
+
+    def test_statuses(self):
+        worked = self.add_shift(-5, time(9), time(17))
+        missed = self.add_shift(-4, time(9), time(17))
+        upcoming = self.add_shift(2, time(9), time(17))
+        self.clock_in(-5, time(9, 5))
+        statuses = self.get_statuses()
+        self.assertEqual(statuses, {worked.id: "worked", missed.id: "missed", upcoming.id: "upcoming"})
+
+    def test_early_clock_in_before_midnight_counts_for_next_shift(self):
+        previous = self.add_shift(-4, time(9), time(17))
+        midnight = self.add_shift(-3, time(0), time(8))
+        self.clock_in(-4, time(23, 50))
+        statuses = self.get_statuses()
+        self.assertEqual(statuses[previous.id], "missed")
+        self.assertEqual(statuses[midnight.id], "worked")
+
+    def test_overnight_shift(self):
+        worked = self.add_shift(-3, time(22), time(6))
+        missed = self.add_shift(-2, time(22), time(6))
+        self.clock_in(-2, time(3))  # середина ночной смены, начатой накануне
+        statuses = self.get_statuses()
+        self.assertEqual(statuses[worked.id], "worked")
+        self.assertEqual(statuses[missed.id], "missed")
+
+    def test_other_employees_shifts_are_excluded(self):
+        mine = self.add_shift(1, time(9), time(17))
+        self.add_shift(1, time(9), time(17), employee=make_employee("other"))
+        self.assertEqual(list(self.get_statuses()), [mine.id])
+
+    def test_invalid_range(self):
+        reversed_range = {"date_from": str(self.today), "date_to": str(self.today - timedelta(days=1))}
+        too_long = {"date_from": str(self.today), "date_to": str(self.today + timedelta(days=400))}
+        self.assertEqual(self.client.get(MY_SHIFTS_URL, reversed_range).status_code, 400)
+        self.assertEqual(self.client.get(MY_SHIFTS_URL, too_long).status_code, 400)
+
+    def test_ics_conditional_get(self):
+        self.add_shift(1, time(9), time(17))
+        response = self.client.get(MY_SHIFTS_ICS_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        self.assertIn(b"BEGIN:VEVENT", response.content)
+        cached = self.client.get(MY_SHIFTS_ICS_URL, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_ics_sequence_follows_status(self):
+        self.add_shift(1, time(9), time(17))
+        self.add_shift(-3, time(9), time(17))
+        self.add_shift(-2, time(9), time(17))
+        self.clock_in(-2, time(8, 50))
+        content = self.client.get(MY_SHIFTS_ICS_URL, {"date_from": str(self.today - timedelta(days=5))}).content
+        self.assertEqual(
+            [line for line in content.split(b"\r\n") if line.startswith(b"SEQUENCE:")],
+            [b"SEQUENCE:1", b"SEQUENCE:2", b"SEQUENCE:0"],
+        )
+        current = now().strftime("%Y%m%dT%H%M%SZ").encode()
+        for line in content.split(b"\r\n"):
+            if line.startswith(b"DTSTAMP:"):
+                self.assertLessEqual(line.split(b":", 1)[1], current)
+
+    def test_ics_long_lines_are_folded(self):
+        self.employee.user.username = "сотрудник" * 16
+        self.employee.user.save()
+        response = self.client.get(MY_SHIFTS_ICS_URL)
+        for line in response.content.split(b"\r\n"):
+            self.assertLessEqual(len(line), 75)
+        self.assertIn(b"\r\n ", response.content)
+
+    def test_ics_calendar_token(self):
+        self.add_shift(1, time(9), time(17))
+        self.assertEqual(Client().get(MY_SHIFTS_ICS_URL).status_code, 401)
+        self.assertEqual(Client().get(MY_SHIFTS_ICS_URL, {"token": "wrong"}).status_code, 401)
+
+        token = self.client.post(CALENDAR_TOKEN_URL).json()
+        self.assertTrue(token["url"].endswith(f"{MY_SHIFTS_ICS_URL}?token={token['token']}"))
+        self.assertEqual(Client().get(MY_SHIFTS_ICS_URL, {"token": token["token"]}).status_code, 200)
+
+        self.client.delete(CALENDAR_TOKEN_URL)
+        self.assertEqual(Client().get(MY_SHIFTS_ICS_URL, {"token": token["token"]}).status_code, 401)
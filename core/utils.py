@@ -1,6 +1,17 @@
+import re
+from functools import wraps
+from hashlib import sha256
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
 from ninja.errors import HttpError
 from .models import Employee, Role
 
+IDEMPOTENCY_KEY_TTL = getattr(settings, "IDEMPOTENCY_KEY_TTL", 60 * 60 * 24)
+IDEMPOTENCY_LOCK_TIMEOUT = getattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT", 10)
+IDEMPOTENCY_KEY_RE = re.compile(r"^[\x21-\x7e]{1,255}$")
+
 def is_hr_or_admin(user):
     try:
         employee = Employee.objects.get(user=user)
@@ -11,3 +22,53 @@ def is_hr_or_admin(user):
 def require_hr_or_admin(request):
     if not is_hr_or_admin(request.auth):
         raise HttpError(403, "Доступ разрешён только HR или администратору")
+
+def idempotency_cache_key(user_id, path, key):
+    # Ключ хешируется, чтобы не упираться в ограничения memcached на длину и символы
+    digest = sha256(f"{user_id}:{path}:{key}".encode()).hexdigest()
+    return f"idempotency:{digest}"
+
+def idempotent(schema):
+    """
+    Повторяет первый успешный ответ для запросов с одинаковым заголовком Idempotency-Key.
+
+    В кеше на IDEMPOTENCY_KEY_TTL секунд хранится ответ, сериализованный схемой
+    schema. Ошибки не кешируются, а параллельный дубликат сразу получает 409 с Retry-After.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get("Idempotency-Key")
+            if key is None:
+                return view_func(request, *args, **kwargs)
+            if not IDEMPOTENCY_KEY_RE.match(key):
+                raise HttpError(400, "Idempotency-Key должен содержать от 1 до 255 печатных ASCII-символов")
+
+            cache_key = idempotency_cache_key(request.auth.pk, request.path, key)
+            lock_key = f"{cache_key}:lock"
+
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return stored
+
+            lock_token = uuid4().hex
+            if not cache.add(lock_key, lock_token, IDEMPOTENCY_LOCK_TIMEOUT):
+                response = JsonResponse({"detail": "Запрос с этим Idempotency-Key уже обрабатывается"}, status=409)
+                response["Retry-After"] = "1"
+                return response
+
+            try:
+                # Первый запрос мог завершиться между проверкой кеша и взятием лока
+                stored = cache.get(cache_key)
+                if stored is not None:
+                    return stored
+                payload = schema.model_validate(view_func(request, *args, **kwargs)).model_dump(mode="json")
+                cache.set(cache_key, payload, IDEMPOTENCY_KEY_TTL)
+                return payload
+            finally:
+                # Лок мог истечь и достаться другому запросу — удаляем только свой
+                if cache.get(lock_key) == lock_token:
+                    cache.delete(lock_key)
+
+        return wrapper
+    return decorator
@@ -96,6 +96,21 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'hr-api',
+    }
+}
+
+# Idempotency-Key для /time-entry/start и /time-entry/stop
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24   # сколько хранить первый ответ, сек
+IDEMPOTENCY_LOCK_TIMEOUT = 10        # сколько держать лок на параллельные повторы, сек
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 